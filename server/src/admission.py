@@ -0,0 +1,116 @@
+import math
+import time
+import logging
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict
+from fastapi import HTTPException
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+logger = logging.getLogger(__name__)
+
+# Least recently seen sources are forgotten past this many buckets
+MAX_TRACKED_SOURCES = 10000
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens: float, updated: float):
+        self.tokens = tokens
+        self.updated = updated
+
+
+class AdmissionController:
+    """Bounded in-flight limit plus per-source token buckets for ingestion"""
+
+    def __init__(
+        self, max_in_flight: int = 10, rate_per_source: float = 5, burst: int = 20
+    ):
+        self.configure(max_in_flight, rate_per_source, burst)
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected_overloaded = 0
+        self.rejected_rate_limited = 0
+        self.rejected_pool_timeout = 0
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+
+    def configure(self, max_in_flight: int, rate_per_source: float, burst: int):
+        self.max_in_flight = max_in_flight
+        self.rate_per_source = rate_per_source
+        self.burst = burst
+
+    @contextmanager
+    def admit(self, source: str):
+        """Reject with 503/429 and Retry-After instead of queuing the request"""
+        if self.in_flight >= self.max_in_flight:
+            self.rejected_overloaded += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Server overloaded",
+                headers={"Retry-After": "1"},
+            )
+
+        retry_after = self._take_token(source)
+        if retry_after > 0:
+            self.rejected_rate_limited += 1
+            raise HTTPException(
+                status_code=429,
+                detail="Rate limit exceeded",
+                headers={"Retry-After": str(math.ceil(retry_after))},
+            )
+
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        except PoolTimeoutError:
+            # The write pool is saturated by something else, shed instead of 500
+            self.rejected_pool_timeout += 1
+            raise HTTPException(
+                status_code=503,
+                detail="Database busy",
+                headers={"Retry-After": "1"},
+            )
+        finally:
+            self.in_flight -= 1
+
+    def _take_token(self, source: str) -> float:
+        """Consume a token, or return the seconds until one is available"""
+        if self.rate_per_source <= 0:
+            return 0
+
+        now = time.monotonic()
+        bucket = self._buckets.get(source)
+        if bucket is None:
+            if len(self._buckets) >= MAX_TRACKED_SOURCES:
+                # A forgotten source starts again with a full bucket
+                self._buckets.popitem(last=False)
+            bucket = TokenBucket(self.burst, now)
+            self._buckets[source] = bucket
+        else:
+            self._buckets.move_to_end(source)
+            bucket.tokens = min(
+                self.burst,
+                bucket.tokens + (now - bucket.updated) * self.rate_per_source,
+            )
+            bucket.updated = now
+
+        if bucket.tokens < 1:
+            return (1 - bucket.tokens) / self.rate_per_source
+        bucket.tokens -= 1
+        return 0
+
+    def stats(self) -> Dict:
+        return {
+            "in_flight": self.in_flight,
+            "max_in_flight": self.max_in_flight,
+            "admitted": self.admitted,
+            "rejected_overloaded": self.rejected_overloaded,
+            "rejected_rate_limited": self.rejected_rate_limited,
+            "rejected_pool_timeout": self.rejected_pool_timeout,
+            "tracked_sources": len(self._buckets),
+        }
+
+
+ingest_admission = AdmissionController()
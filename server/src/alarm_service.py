@@ -0,0 +1,399 @@
+import time
+import uuid
+import math
+import asyncio
+import logging
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict, deque
+from typing import Dict, List, Optional, Set, Tuple
+from models import AlarmRule
+
+logger = logging.getLogger(__name__)
+
+WINDOW_TYPES = {"mean_above", "mean_below", "std_above"}
+SUBSCRIBER_QUEUE_SIZE = 1000
+# Least recently updated streams are forgotten past this many. A forgotten
+# stream starts over, so its active rules report "triggered" again.
+MAX_STREAMS = 10000
+
+StreamKey = Tuple[str, str]
+RuleKey = Tuple[str, Optional[str]]
+
+
+class WindowStats:
+    """Running mean/std over a time window, O(1) amortized per sample
+
+    Sums are kept relative to a reference value and rebuilt from the window
+    once as many samples have been evicted as it holds, so rounding error
+    from adding and subtracting cannot build up over a long stream.
+    """
+
+    __slots__ = ("window_seconds", "samples", "ref", "total", "total_sq", "evicted")
+
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self.samples = deque()
+        self.ref: Optional[float] = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.evicted = 0
+
+    def add(self, ts: float, value: float):
+        if self.ref is None:
+            self.ref = value
+        samples = self.samples
+        samples.append((ts, value))
+        delta = value - self.ref
+        self.total += delta
+        self.total_sq += delta * delta
+
+        # Each sample is evicted exactly once, so the cost amortizes to O(1)
+        cutoff = ts - self.window_seconds
+        while samples[0][0] < cutoff:
+            _, old = samples.popleft()
+            delta = old - self.ref
+            self.total -= delta
+            self.total_sq -= delta * delta
+            self.evicted += 1
+
+        if self.evicted >= len(samples):
+            self._rebuild()
+
+    def _rebuild(self):
+        """Recompute the sums exactly, around the current mean"""
+        self.ref = self.mean
+        self.total = 0.0
+        self.total_sq = 0.0
+        for _, value in self.samples:
+            delta = value - self.ref
+            self.total += delta
+            self.total_sq += delta * delta
+        self.evicted = 0
+
+    @property
+    def mean(self) -> float:
+        return self.ref + self.total / len(self.samples)
+
+    @property
+    def std(self) -> float:
+        n = len(self.samples)
+        shift = self.total / n
+        # Clamp: rounding can leave a tiny negative variance
+        return math.sqrt(max(0.0, self.total_sq / n - shift * shift))
+
+
+# Observed quantity and direction for each rule type. A rule is triggered
+# while the observation is above (or below) its threshold.
+RULE_KINDS = {
+    "above": ("value", True),
+    "below": ("value", False),
+    "rate_above": ("rate", True),
+    "rate_below": ("rate", False),
+    "mean_above": ("mean", True),
+    "mean_below": ("mean", False),
+    "std_above": ("std", True),
+}
+
+ObservationKey = Tuple[str, int]
+
+
+class ThresholdGroup:
+    """Rules of one stream sharing an observation, sorted by threshold
+
+    Whether a rule is triggered only depends on where the observation sits
+    among the thresholds, so the rules that changed state between two
+    readings are a contiguous slice found with two bisections.
+    """
+
+    __slots__ = ("kind", "window_seconds", "above", "thresholds", "rule_ids")
+
+    def __init__(self, kind: str, window_seconds: int, above: bool, rules):
+        rules = sorted(rules, key=lambda item: item[1].threshold)
+        self.kind = kind
+        self.window_seconds = window_seconds
+        self.above = above
+        self.thresholds = [rule.threshold for _, rule in rules]
+        self.rule_ids = [rule_id for rule_id, _ in rules]
+
+    def active_range(self, observed: float) -> Tuple[int, int]:
+        """Indexes of the rules triggered by an observation"""
+        if self.above:
+            return 0, bisect_left(self.thresholds, observed)
+        return bisect_right(self.thresholds, observed), len(self.thresholds)
+
+    def transitions(
+        self, previous: Optional[float], observed: float
+    ) -> Tuple[int, int, bool]:
+        """Slice of rules that changed state and whether they triggered"""
+        start, end = self.active_range(observed)
+        if previous is None:
+            return start, end, True
+
+        prev_start, prev_end = self.active_range(previous)
+        if self.above:
+            if end > prev_end:
+                return prev_end, end, True
+            return end, prev_end, False
+        if start < prev_start:
+            return start, prev_start, True
+        return prev_start, start, False
+
+
+def observation_key(rule: AlarmRule) -> ObservationKey:
+    kind, _ = RULE_KINDS[rule.type]
+    return kind, rule.window_seconds if rule.type in WINDOW_TYPES else 0
+
+
+def is_triggered(rule: AlarmRule, observed: float) -> bool:
+    _, above = RULE_KINDS[rule.type]
+    return observed > rule.threshold if above else observed < rule.threshold
+
+
+class StreamState:
+    """Per sensor/source state shared by every rule that watches it"""
+
+    __slots__ = ("last_ts", "last_value", "windows", "observed", "version")
+
+    def __init__(self):
+        # Rule version the windows were last reconciled against
+        self.version = -1
+        self.last_ts: Optional[float] = None
+        self.last_value: Optional[float] = None
+        self.windows: Dict[int, WindowStats] = {}
+        # Last observation per kind/window, rule state is derived from it
+        self.observed: Dict[ObservationKey, float] = {}
+
+
+class AlarmEngine:
+    def __init__(self):
+        self.rules: Dict[str, AlarmRule] = {}
+        self.dropped_events = 0
+        self._version = 0
+        # Exact-source rules under (sensor, source), wildcards under (sensor, None)
+        self._by_key: Dict[RuleKey, Dict[str, AlarmRule]] = {}
+        self._groups: Dict[RuleKey, List[ThresholdGroup]] = {}
+        self._streams: "OrderedDict[StreamKey, StreamState]" = OrderedDict()
+        self._subscribers: Set[asyncio.Queue] = set()
+
+    def add_rule(self, rule: AlarmRule) -> str:
+        rule_id = uuid.uuid4().hex
+        self.rules[rule_id] = rule
+        if not rule.enabled:
+            return rule_id
+        self._index(rule_id, rule)
+
+        # Streams already past the new threshold report it right away
+        key = observation_key(rule)
+        if rule.source is None:
+            streams = self._streams.items()
+        else:
+            stream = (rule.sensor, rule.source)
+            state = self._streams.get(stream)
+            streams = [(stream, state)] if state is not None else []
+        for (sensor, source), state in streams:
+            if sensor != rule.sensor:
+                continue
+            observed = state.observed.get(key)
+            if observed is not None and is_triggered(rule, observed):
+                event = self._event(
+                    rule_id,
+                    rule,
+                    True,
+                    sensor,
+                    source,
+                    None,
+                    observed,
+                    state.last_ts,
+                )
+                self._publish(event)
+        return rule_id
+
+    def remove_rule(self, rule_id: str) -> bool:
+        rule = self.rules.pop(rule_id, None)
+        if rule is None:
+            return False
+        if rule.enabled:
+            self._unindex(rule_id, rule)
+        return True
+
+    def clear_rules(self):
+        self.rules.clear()
+        self._by_key.clear()
+        self._groups.clear()
+        self._version += 1
+
+    def _index(self, rule_id: str, rule: AlarmRule):
+        key = (rule.sensor, rule.source)
+        self._by_key.setdefault(key, {})[rule_id] = rule
+        self._invalidate(key)
+
+    def _unindex(self, rule_id: str, rule: AlarmRule):
+        key = (rule.sensor, rule.source)
+        rules = self._by_key[key]
+        del rules[rule_id]
+        if not rules:
+            del self._by_key[key]
+        self._invalidate(key)
+
+    def _invalidate(self, key: RuleKey):
+        """Only the changed key's groups are rebuilt, lazily on next use"""
+        self._groups.pop(key, None)
+        self._version += 1
+
+    def _groups_for(self, key: RuleKey) -> List[ThresholdGroup]:
+        groups = self._groups.get(key)
+        if groups is None:
+            rules = self._by_key.get(key)
+            if rules is None:
+                return []
+            by_observation: Dict[Tuple[str, int, bool], list] = {}
+            for rule_id, rule in rules.items():
+                kind, window = observation_key(rule)
+                _, above = RULE_KINDS[rule.type]
+                by_observation.setdefault((kind, window, above), []).append(
+                    (rule_id, rule)
+                )
+            groups = [
+                ThresholdGroup(kind, window, above, group_rules)
+                for (kind, window, above), group_rules in by_observation.items()
+            ]
+            self._groups[key] = groups
+        return groups
+
+    @staticmethod
+    def _reconcile_windows(state: StreamState, groups: List[ThresholdGroup]):
+        """Drop windows no rule needs any more, create the ones new rules need"""
+        needed = {
+            group.window_seconds for group in groups if group.kind in ("mean", "std")
+        }
+        for window in list(state.windows):
+            if window not in needed:
+                del state.windows[window]
+        for window in needed:
+            if window not in state.windows:
+                state.windows[window] = WindowStats(window)
+
+    def evaluate(
+        self, sensor: str, source: str, value: float, ts: Optional[float] = None
+    ) -> List[Dict]:
+        """Update stream state with a reading and return alarm transitions
+
+        Costs O(windows + groups * log(rules) + transitions) per reading.
+        """
+        if not math.isfinite(value):
+            return []
+        groups = self._groups_for((sensor, source)) + self._groups_for(
+            (sensor, None)
+        )
+        key = (sensor, source)
+        if not groups:
+            # Nothing watches this stream, keep no state for it
+            self._streams.pop(key, None)
+            return []
+
+        if ts is None:
+            ts = time.time()
+
+        state = self._streams.get(key)
+        if state is None:
+            state = StreamState()
+            self._streams[key] = state
+            if len(self._streams) > MAX_STREAMS:
+                self._streams.popitem(last=False)
+        else:
+            self._streams.move_to_end(key)
+
+        if state.version != self._version:
+            self._reconcile_windows(state, groups)
+            state.version = self._version
+
+        for window in state.windows.values():
+            window.add(ts, value)
+        rate = None
+        if state.last_ts is not None and ts > state.last_ts:
+            rate = (value - state.last_value) * 60.0 / (ts - state.last_ts)
+        state.last_ts = ts
+        state.last_value = value
+
+        events = []
+        current: Dict[ObservationKey, float] = {}
+        for group in groups:
+            if group.kind == "value":
+                observed = value
+            elif group.kind == "rate":
+                observed = rate
+            elif group.kind == "mean":
+                observed = state.windows[group.window_seconds].mean
+            else:
+                observed = state.windows[group.window_seconds].std
+            if observed is None:
+                continue
+
+            observation = (group.kind, group.window_seconds)
+            current[observation] = observed
+            start, end, triggered = group.transitions(
+                state.observed.get(observation), observed
+            )
+
+            # Only state changes are published, not every reading past a threshold
+            for index in range(start, end):
+                rule_id = group.rule_ids[index]
+                events.append(
+                    self._event(
+                        rule_id,
+                        self.rules[rule_id],
+                        triggered,
+                        sensor,
+                        source,
+                        value,
+                        observed,
+                        ts,
+                    )
+                )
+        state.observed.update(current)
+
+        for event in events:
+            self._publish(event)
+        return events
+
+    @staticmethod
+    def _event(
+        rule_id: str,
+        rule: AlarmRule,
+        triggered: bool,
+        sensor: str,
+        source: str,
+        value: Optional[float],
+        observed: float,
+        ts: Optional[float],
+    ) -> Dict:
+        return {
+            "rule_id": rule_id,
+            "state": "triggered" if triggered else "cleared",
+            "type": rule.type,
+            "sensor": sensor,
+            "source": source,
+            "value": value,
+            "observed": observed,
+            "threshold": rule.threshold,
+            "timestamp": ts,
+        }
+
+    def subscribe(self) -> asyncio.Queue:
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+
+    def _publish(self, event: Dict):
+        for queue in self._subscribers:
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                # A slow client must never stall ingestion
+                self.dropped_events += 1
+
+
+alarm_engine = AlarmEngine()
@@ -0,0 +1,259 @@
+import os
+import csv
+import json
+import time
+import asyncio
+import argparse
+from itertools import islice
+from datetime import datetime, timezone
+from typing import Iterator, Optional, get_args
+
+import asyncpg
+from dotenv import load_dotenv
+
+from config import setup_logging
+from models import METRICS, SensorType
+
+load_dotenv()
+logger = setup_logging()
+
+COLUMNS = ("timestamp", "source", "sensor", "value")
+SENSORS = set(get_args(SensorType))
+FORMATS = ("csv", "ndjson", "parquet")
+REPORT_EVERY = 100_000
+
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".ndjson", ".jsonl", ".json"):
+        return "ndjson"
+    if ext in (".parquet", ".pq"):
+        return "parquet"
+    raise ValueError(f"Cannot detect format of {path}, use --format")
+
+
+def parse_timestamp(value) -> datetime:
+    if isinstance(value, datetime):
+        ts = value
+    elif hasattr(value, "to_pydatetime"):
+        ts = value.to_pydatetime()
+    else:
+        ts = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return ts
+
+
+def to_record(row: dict) -> Optional[tuple]:
+    """Convert an input row into a COPY record, None if it is invalid"""
+    try:
+        sensor = row["sensor"]
+        if sensor not in SENSORS:
+            return None
+        return (
+            parse_timestamp(row["timestamp"]),
+            str(row["source"]),
+            sensor,
+            float(row["value"]),
+        )
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def read_csv(path: str) -> Iterator[dict]:
+    with open(path, newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def read_ndjson(path: str) -> Iterator[dict]:
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                yield {}
+
+
+def read_parquet(path: str, batch_size: int) -> Iterator[dict]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet input requires pyarrow (uv add pyarrow)")
+
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=COLUMNS):
+        yield from batch.to_pylist()
+
+
+def parse_batch(rows: Iterator[dict], batch_size: int) -> tuple[list, int, int]:
+    """Read up to batch_size rows, returning (records, skipped, rows read)"""
+    records = []
+    skipped = 0
+    read = 0
+    for row in islice(rows, batch_size):
+        read += 1
+        record = to_record(row)
+        if record is None:
+            skipped += 1
+        else:
+            records.append(record)
+    return records, skipped, read
+
+
+def read_rows(path: str, fmt: str, batch_size: int) -> Iterator[dict]:
+    if fmt == "csv":
+        return read_csv(path)
+    if fmt == "ndjson":
+        return read_ndjson(path)
+    return read_parquet(path, batch_size)
+
+
+class Backfill:
+    def __init__(self, dsn: str, batch_size: int = 5000, workers: int = 1):
+        self.dsn = dsn
+        self.batch_size = batch_size
+        self.workers = workers
+        self.inserted = 0
+        self.skipped = 0
+        self.started = 0.0
+
+    async def run(self, paths: list[str], fmt: Optional[str] = None):
+        self.started = time.monotonic()
+
+        # Bounded so the reader never gets far ahead of the COPY workers
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 2)
+        tasks = [asyncio.create_task(self._produce(queue, paths, fmt))] + [
+            asyncio.create_task(self._worker(queue)) for _ in range(self.workers)
+        ]
+
+        # Fail fast: a broken worker must not leave the reader blocked on put()
+        done, pending = await asyncio.wait(
+            tasks, return_when=asyncio.FIRST_EXCEPTION
+        )
+        for task in pending:
+            task.cancel()
+        for task in done:
+            task.result()
+
+        await self._refresh_aggregates()
+
+        elapsed = time.monotonic() - self.started
+        rate = self.inserted / elapsed if elapsed > 0 else 0
+        logger.info(
+            f"Inserted {self.inserted} rows ({self.skipped} skipped) "
+            f"in {elapsed:.1f}s, {rate:.0f} rows/s"
+        )
+
+    async def _produce(
+        self, queue: asyncio.Queue, paths: list[str], fmt: Optional[str]
+    ):
+        for path in paths:
+            logger.info(f"Loading {path}")
+            rows = read_rows(path, fmt or detect_format(path), self.batch_size)
+            while True:
+                # Parse off the event loop so COPY keeps streaming meanwhile
+                batch, skipped, read = await asyncio.to_thread(
+                    parse_batch, rows, self.batch_size
+                )
+                self.skipped += skipped
+                if batch:
+                    await queue.put(batch)
+                if read < self.batch_size:
+                    break
+
+        for _ in range(self.workers):
+            await queue.put(None)
+
+    async def _worker(self, queue: asyncio.Queue):
+        conn = await asyncpg.connect(self.dsn)
+        try:
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    break
+                await conn.copy_records_to_table(
+                    METRICS, records=batch, columns=COLUMNS
+                )
+                previous = self.inserted
+                self.inserted += len(batch)
+                if self.inserted // REPORT_EVERY > previous // REPORT_EVERY:
+                    elapsed = time.monotonic() - self.started
+                    logger.info(
+                        f"{self.inserted} rows, {self.inserted / elapsed:.0f} rows/s"
+                    )
+        finally:
+            await conn.close()
+
+    async def _refresh_aggregates(self):
+        """Refresh materialized views built on metrics and update planner stats"""
+        conn = await asyncpg.connect(self.dsn)
+        try:
+            # A view's rewrite rule records a dependency on every table it reads
+            views = await conn.fetch(
+                "SELECT DISTINCT v.oid::regclass::text AS name "
+                "FROM pg_depend d "
+                "JOIN pg_rewrite r ON r.oid = d.objid "
+                "JOIN pg_class v ON v.oid = r.ev_class "
+                "WHERE d.classid = 'pg_rewrite'::regclass "
+                "AND d.refclassid = 'pg_class'::regclass "
+                "AND d.refobjid = $1::regclass "
+                "AND v.relkind = 'm'",
+                METRICS,
+            )
+            for view in views:
+                name = view["name"]
+                logger.info(f"Refreshing {name}")
+                await conn.execute(f"REFRESH MATERIALIZED VIEW {name}")
+
+            await conn.execute(f"ANALYZE {METRICS}")
+        finally:
+            await conn.close()
+
+
+def asyncpg_dsn(database_url: str) -> str:
+    """Strip the SQLAlchemy driver suffix so asyncpg accepts the URL"""
+    return database_url.replace("postgresql+asyncpg://", "postgresql://", 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Bulk load historical metrics into the database",
+        epilog="Each batch is committed on its own. If a load fails part way, "
+        "the batches already copied stay, so re-running the same files "
+        "duplicates them.",
+    )
+    parser.add_argument("paths", nargs="+", help="CSV, NDJSON or Parquet files")
+    parser.add_argument("--format", choices=FORMATS, help="Input format")
+    parser.add_argument(
+        "--batch-size", type=int, default=5000, help="Rows per COPY (and commit)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Parallel COPY connections; parsing runs in a single background thread",
+    )
+    parser.add_argument(
+        "--database-url", default=os.getenv("DATABASE_URL"), help="Database URL"
+    )
+    args = parser.parse_args()
+
+    if not args.database_url:
+        parser.error("DATABASE_URL is not set, use --database-url")
+
+    backfill = Backfill(
+        asyncpg_dsn(args.database_url),
+        batch_size=max(1, args.batch_size),
+        workers=max(1, args.workers),
+    )
+    asyncio.run(backfill.run(args.paths, args.format))
+
+
+if __name__ == "__main__":
+    main()
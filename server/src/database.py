@@ -1,8 +1,9 @@
 import logging
 import asyncio
+import hashlib
 from typing import Optional
 from models import MetricModel, Base
-from sqlalchemy import text, select
+from sqlalchemy import text, select, bindparam, func
 from datetime import datetime, timezone, timedelta
 from sqlalchemy.ext.asyncio import (
     AsyncEngine,
@@ -14,35 +15,135 @@ from sqlalchemy.ext.asyncio import (
 logger = logging.getLogger(__name__)
 
 
+# SQLAlchemy's asyncpg driver already prepares statements and keeps 100 per
+# connection; this only raises that limit so the few hot queries are not
+# evicted by occasional ones.
+STATEMENT_CACHE_SIZE = 256
+
+# History query with bound parameters, built once and reused; SQLAlchemy
+# would cache its compiled form either way.
+HISTORY_QUERY = (
+    select(
+        MetricModel.timestamp,
+        MetricModel.value,
+        MetricModel.sensor,
+        MetricModel.source,
+    )
+    .filter(
+        MetricModel.sensor == bindparam("sensor"),
+        MetricModel.timestamp >= bindparam("from_dt"),
+        MetricModel.timestamp <= bindparam("to_dt"),
+    )
+    .order_by(MetricModel.timestamp)
+)
+
+
+# Row count and newest row in a history range; changes whenever the
+# aggregated buckets could change.
+HISTORY_VERSION_QUERY = select(
+    func.count(MetricModel.id),
+    func.max(MetricModel.id),
+    func.max(MetricModel.timestamp),
+).filter(
+    MetricModel.sensor == bindparam("sensor"),
+    MetricModel.timestamp >= bindparam("from_dt"),
+    MetricModel.timestamp <= bindparam("to_dt"),
+)
+
+
+class PoolConfig:
+    def __init__(
+        self,
+        pool_size: int = 10,
+        max_overflow: int = 0,
+        pool_timeout: float = 30,
+        pool_recycle: int = 1800,
+        pool_pre_ping: bool = False,
+    ):
+        self.pool_size = pool_size
+        self.max_overflow = max_overflow
+        self.pool_timeout = pool_timeout
+        self.pool_recycle = pool_recycle
+        self.pool_pre_ping = pool_pre_ping
+
+
+class HistoryWindow:
+    def __init__(
+        self, from_dt: datetime, to_dt: datetime, origin: datetime, bucket_minutes: int
+    ):
+        self.from_dt = from_dt
+        self.to_dt = to_dt
+        self.origin = origin
+        self.bucket_minutes = bucket_minutes
+
+
 class Instance:
     def __init__(
-        self, engine: AsyncEngine, session_factory: async_sessionmaker[AsyncSession]
+        self,
+        engine: AsyncEngine,
+        session_factory: async_sessionmaker[AsyncSession],
+        read_engine: AsyncEngine,
+        read_session_factory: async_sessionmaker[AsyncSession],
     ):
         self.engine = engine
         self.session_factory = session_factory
+        self.read_engine = read_engine
+        self.read_session_factory = read_session_factory
+
+    @property
+    def engines(self) -> list[AsyncEngine]:
+        return [self.engine, self.read_engine]
 
 
 class Database:
     _instance: Optional[Instance] = None
 
     @staticmethod
-    def initialize(connection_string: str):
+    def initialize(
+        connection_string: str,
+        replica_connection_string: Optional[str] = None,
+        write_pool: Optional[PoolConfig] = None,
+        read_pool: Optional[PoolConfig] = None,
+    ):
         if Database._instance is None:
-            Database._instance = Database._create_instance(connection_string)
+            Database._instance = Database._create_instance(
+                connection_string, replica_connection_string, write_pool, read_pool
+            )
 
     @staticmethod
-    def _create_instance(connection_string: str):
-        engine = create_async_engine(
+    def _create_engine(connection_string: str, pool: PoolConfig) -> AsyncEngine:
+        return create_async_engine(
             connection_string,
-            pool_size=10,
-            max_overflow=0,
-            pool_pre_ping=True,
+            pool_size=pool.pool_size,
+            max_overflow=pool.max_overflow,
+            pool_timeout=pool.pool_timeout,
+            pool_recycle=pool.pool_recycle,
+            pool_pre_ping=pool.pool_pre_ping,
+            connect_args={"prepared_statement_cache_size": STATEMENT_CACHE_SIZE},
             echo=False,
         )
+
+    @staticmethod
+    def _create_instance(
+        connection_string: str,
+        replica_connection_string: Optional[str] = None,
+        write_pool: Optional[PoolConfig] = None,
+        read_pool: Optional[PoolConfig] = None,
+    ):
+        engine = Database._create_engine(connection_string, write_pool or PoolConfig())
         session_factory = async_sessionmaker(
             engine, class_=AsyncSession, expire_on_commit=False
         )
-        return Instance(engine, session_factory)
+
+        # Reads always get their own pool so history and training queries do
+        # not compete with ingest writes, even without a replica.
+        read_engine = Database._create_engine(
+            replica_connection_string or connection_string, read_pool or PoolConfig()
+        )
+        read_session_factory = async_sessionmaker(
+            read_engine, class_=AsyncSession, expire_on_commit=False
+        )
+        return Instance(engine, session_factory, read_engine, read_session_factory)
 
     @staticmethod
     async def wait_for_connection():
@@ -51,15 +152,18 @@ class Database:
                 "Database not initialized. Call Database.initialize() first."
             )
 
-        while True:
-            try:
-                async with Database._instance.engine.begin() as conn:
-                    await conn.execute(text("SELECT 1"))
-                logger.info("Database connection established.")
-                break
-            except Exception as e:
-                logger.info(f"Waiting for database connection... ({e})")
-                await asyncio.sleep(1)
+        for engine in Database._instance.engines:
+            while True:
+                try:
+                    async with engine.begin() as conn:
+                        await conn.execute(text("SELECT 1"))
+                    logger.info(
+                        f"Database connection established ({engine.url.host})."
+                    )
+                    break
+                except Exception as e:
+                    logger.info(f"Waiting for database connection... ({e})")
+                    await asyncio.sleep(1)
 
     @staticmethod
     async def create_tables():
@@ -78,7 +182,8 @@ class Database:
                 "Database not initialized. Call Database.initialize() first."
             )
 
-        await Database._instance.engine.dispose()
+        for engine in Database._instance.engines:
+            await engine.dispose()
 
     @staticmethod
     def get_session() -> AsyncSession:
@@ -89,6 +194,15 @@ class Database:
 
         return Database._instance.session_factory()
 
+    @staticmethod
+    def get_read_session() -> AsyncSession:
+        if Database._instance is None:
+            raise Exception(
+                "Database not initialized. Call Database.initialize() first."
+            )
+
+        return Database._instance.read_session_factory()
+
     @staticmethod
     async def create_metric(metric: MetricModel) -> int:
         async with Database.get_session() as session:
@@ -103,104 +217,149 @@ class Database:
         from_time: Optional[str] = None,
         to_time: Optional[str] = None,
         target_points: int = 60,
+        since: Optional[datetime] = None,
+        origin: Optional[datetime] = None,
+        bucket_minutes: Optional[int] = None,
     ):
-        async with Database.get_session() as session:
+        window = Database.get_history_window(
+            from_time, to_time, target_points, since, origin, bucket_minutes
+        )
+        if window is None:
+            return []
+
+        return await Database.get_window_metrics(sensor, window)
+
+    @staticmethod
+    async def get_window_metrics(sensor: str, window: HistoryWindow):
+        async with Database.get_read_session() as session:
             # Always use minute-based aggregation with automatic interval calculation
             return await Database._get_minute_aggregated_metrics(
-                session, sensor, from_time, to_time, target_points
+                session, sensor, window
             )
 
     @staticmethod
-    async def _get_minute_aggregated_metrics(
-        session, sensor, from_time, to_time, target_points
-    ):
+    async def get_window_etag(sensor: str, window: HistoryWindow) -> str:
+        """Cheap version tag for a history response, without aggregating it"""
+        async with Database.get_read_session() as session:
+            result = await session.execute(
+                HISTORY_VERSION_QUERY,
+                {"sensor": sensor, "from_dt": window.from_dt, "to_dt": window.to_dt},
+            )
+            count, max_id, max_timestamp = result.one()
+
+        version = (
+            f"{sensor}:{window.from_dt.isoformat()}:{window.origin.isoformat()}:"
+            f"{window.bucket_minutes}:{count}:{max_id}:"
+            f"{max_timestamp.isoformat() if max_timestamp else ''}"
+        )
+        return hashlib.sha1(version.encode()).hexdigest()
+
+    @staticmethod
+    def _parse_time(value: str) -> datetime:
+        return Database._as_utc(datetime.fromisoformat(value.replace("Z", "+00:00")))
+
+    @staticmethod
+    def _as_utc(dt: datetime) -> datetime:
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        return dt
+
+    @staticmethod
+    def get_history_window(
+        from_time: Optional[str] = None,
+        to_time: Optional[str] = None,
+        target_points: int = 60,
+        since: Optional[datetime] = None,
+        origin: Optional[datetime] = None,
+        bucket_minutes: Optional[int] = None,
+    ) -> Optional[HistoryWindow]:
+        """Resolve the query range and bucket grid, None if the range is empty
+
+        Polling clients send back the `origin` and `bucket_minutes` of their
+        first response, so the grid stays put while a rolling range moves.
+        With `since`, only the bucket containing it and newer ones are read.
+        """
         # Determine time range - ensure all dates have timezone
         now = datetime.now(timezone.utc)
-        
+
         if to_time is None:
             to_dt = now
         else:
-            to_dt = datetime.fromisoformat(to_time.replace("Z", "+00:00"))
-            if to_dt.tzinfo is None:
-                to_dt = to_dt.replace(tzinfo=timezone.utc)
+            to_dt = Database._parse_time(to_time)
 
         if from_time is None:
             # Default to last 6 hours if no from_time specified
             from_dt = now - timedelta(hours=6)
             from_dt = from_dt.replace(minute=0, second=0, microsecond=0)
         else:
-            from_dt = datetime.fromisoformat(from_time.replace("Z", "+00:00"))
-            if from_dt.tzinfo is None:
-                from_dt = from_dt.replace(tzinfo=timezone.utc)
+            from_dt = Database._parse_time(from_time)
 
         # Calculate total time in minutes
         total_minutes = int((to_dt - from_dt).total_seconds() / 60)
 
         if total_minutes <= 0:
-            return []
+            return None
 
         # Calculate interval in minutes for aggregation
-        interval_minutes = max(1, total_minutes // target_points)
+        if bucket_minutes is None:
+            bucket_minutes = max(1, total_minutes // target_points)
 
-        time_buckets = []
-        current_time = from_dt.replace(second=0, microsecond=0)
+        # The grid is minute aligned, but rows are still read from from_dt
+        if origin is None:
+            origin = from_dt.replace(second=0, microsecond=0)
+        else:
+            origin = Database._as_utc(origin)
 
-        while current_time <= to_dt:
-            time_buckets.append(current_time)
-            current_time = current_time + timedelta(minutes=interval_minutes)
+        if since is not None:
+            since_dt = Database._as_utc(since)
+            if since_dt > origin:
+                bucket = timedelta(minutes=bucket_minutes)
+                from_dt = max(
+                    from_dt, origin + bucket * ((since_dt - origin) // bucket)
+                )
+            if from_dt >= to_dt:
+                return None
 
+        return HistoryWindow(from_dt, to_dt, origin, bucket_minutes)
+
+    @staticmethod
+    async def _get_minute_aggregated_metrics(session, sensor, window: HistoryWindow):
         # Query data and aggregate by calculated intervals
-        base_query = (
-            select(
-                MetricModel.timestamp,
-                MetricModel.value,
-                MetricModel.sensor,
-                MetricModel.source,
-            )
-            .filter(
-                MetricModel.sensor == sensor,
-                MetricModel.timestamp >= from_dt,
-                MetricModel.timestamp <= to_dt,
-            )
-            .order_by(MetricModel.timestamp)
+        result = await session.execute(
+            HISTORY_QUERY,
+            {"sensor": sensor, "from_dt": window.from_dt, "to_dt": window.to_dt},
         )
-
-        result = await session.execute(base_query)
         all_data = result.fetchall()
 
         if not all_data:
             return []
 
-        # Create time buckets covering the REQUESTED range (not just data range)
-        # This ensures data is distributed correctly across the requested time period
-        bucket_duration_minutes = max(1, total_minutes // target_points)
-        
-        aggregated_data = []
-        current_bucket_start = from_dt.replace(second=0, microsecond=0)
-        
-        while current_bucket_start < to_dt:
-            bucket_end = current_bucket_start + timedelta(minutes=bucket_duration_minutes)
-            
-            # Find data points in this time bucket
-            bucket_data = [
-                row for row in all_data 
-                if current_bucket_start <= row[0] < bucket_end
-            ]
-            
-            if bucket_data:
-                # Calculate average value for this bucket
-                avg_value = sum(row[1] for row in bucket_data) / len(bucket_data)
-                aggregated_data.append({
-                    "timestamp": current_bucket_start.isoformat(),
-                    "value": float(avg_value),
-                    "sensor": sensor,
-                    "source": bucket_data[0][3],
-                })
-            # Note: We don't add empty buckets - frontend will handle gaps
-            
-            current_bucket_start = bucket_end
-
-        # Sort by timestamp (oldest first)
-        aggregated_data.sort(key=lambda x: x["timestamp"])
-
-        return aggregated_data
+        # Buckets are anchored at the REQUESTED range start (not the data range),
+        # so data is distributed correctly across the requested time period.
+        # Rows arrive ordered by timestamp, so one pass fills every bucket.
+        origin = window.origin
+        bucket_duration = timedelta(minutes=window.bucket_minutes)
+        bucket_count = -((origin - window.to_dt) // bucket_duration)
+        buckets = {}
+
+        for timestamp, value, _, source in all_data:
+            index = (timestamp - origin) // bucket_duration
+            if index >= bucket_count:
+                continue
+            bucket = buckets.get(index)
+            if bucket is None:
+                buckets[index] = [value, 1, source]
+            else:
+                bucket[0] += value
+                bucket[1] += 1
+
+        # Note: We don't add empty buckets - frontend will handle gaps
+        return [
+            {
+                "timestamp": (origin + bucket_duration * index).isoformat(),
+                "value": float(total / count),
+                "sensor": sensor,
+                "source": source,
+            }
+            for index, (total, count, source) in sorted(buckets.items())
+        ]
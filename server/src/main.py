@@ -7,8 +7,10 @@ from dotenv import load_dotenv
 import uvicorn
 
 from config import setup_logging
-from database import Database
-from routes import router
+from database import Database, PoolConfig
+from routes import router, admin_router
+from admission import ingest_admission
+from profiler import start_request_profile, finish_request_profile
 
 load_dotenv()
 logger = setup_logging()
@@ -29,13 +31,60 @@ class AuthMiddleware(BaseHTTPMiddleware):
         return response
 
 
+def pool_config(prefix: str, default_size: int) -> PoolConfig:
+    return PoolConfig(
+        pool_size=int(os.getenv(f"{prefix}_POOL_SIZE", str(default_size))),
+        max_overflow=int(os.getenv(f"{prefix}_MAX_OVERFLOW", "0")),
+        pool_timeout=float(os.getenv(f"{prefix}_POOL_TIMEOUT", "30")),
+        pool_recycle=int(os.getenv(f"{prefix}_POOL_RECYCLE", "1800")),
+        pool_pre_ping=os.getenv(f"{prefix}_POOL_PRE_PING", "false").lower()
+        == "true",
+    )
+
+
+class ProfilingMiddleware(BaseHTTPMiddleware):
+    """Samples requests sent with a `profile` header holding the admin token"""
+
+    def __init__(self, app):
+        super().__init__(app)
+        self.admin_token = os.getenv("ADMIN_TOKEN")
+        self.interval = float(os.getenv("PROFILING_INTERVAL_MS", "5")) / 1000
+
+    async def dispatch(self, request: Request, call_next):
+        if not self.admin_token or request.headers.get("profile") != self.admin_token:
+            return await call_next(request)
+
+        profiler = start_request_profile(self.interval)
+        try:
+            response = await call_next(request)
+        finally:
+            profile_id = finish_request_profile(profiler, request.url.path)
+
+        response.headers["X-Profile-Id"] = profile_id
+        return response
+
+
 @asynccontextmanager
 async def lifespan(_: FastAPI):
     try:
         database_url = os.getenv("DATABASE_URL")
-        Database.initialize(database_url)
+        write_pool = pool_config("DATABASE_WRITE", 10)
+        Database.initialize(
+            database_url,
+            replica_connection_string=os.getenv("DATABASE_REPLICA_URL"),
+            write_pool=write_pool,
+            read_pool=pool_config("DATABASE_READ", 5),
+        )
         logger.info("Database initialized")
 
+        # Never admit more writes than the pool can serve without queuing
+        write_capacity = write_pool.pool_size + write_pool.max_overflow
+        ingest_admission.configure(
+            max_in_flight=int(os.getenv("INGEST_MAX_IN_FLIGHT", str(write_capacity))),
+            rate_per_source=float(os.getenv("INGEST_RATE_PER_SOURCE", "5")),
+            burst=int(os.getenv("INGEST_BURST_PER_SOURCE", "20")),
+        )
+
         await Database.wait_for_connection()
         logger.info("Database connected")
 
@@ -54,6 +103,12 @@ async def lifespan(_: FastAPI):
 
 
 app = FastAPI(title="Server", version="0.1.0", lifespan=lifespan)
+
+# Profiling is wired in only when enabled, so it costs nothing otherwise
+if os.getenv("PROFILING_ENABLED", "false").lower() == "true":
+    app.add_middleware(ProfilingMiddleware)
+    app.include_router(admin_router)
+
 app.add_middleware(AuthMiddleware)
 app.include_router(router)
 
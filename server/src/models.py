@@ -1,7 +1,7 @@
 from sqlalchemy import Column, Integer, String, Float, DateTime, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import declarative_base
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Literal, Optional
 from datetime import datetime
 
@@ -11,11 +11,14 @@ METRICS = "metrics"
 
 SensorType = Literal["temperature", "humidity", "light"]
 ResolutionType = Literal["raw", "hourly", "daily"]
+AlarmRuleType = Literal[
+    "above", "below", "rate_above", "rate_below", "mean_above", "mean_below", "std_above"
+]
 
 class Metric(BaseModel):
     source: str
     sensor: SensorType
-    value: float
+    value: float = Field(allow_inf_nan=False)
 
 class HistoryQuery(BaseModel):
     sensor: SensorType
@@ -24,6 +27,15 @@ class HistoryQuery(BaseModel):
     resolution: ResolutionType = "raw"
     limit: int = 1000
 
+class AlarmRule(BaseModel):
+    sensor: SensorType
+    source: Optional[str] = None  # None matches every source
+    type: AlarmRuleType
+    # rate_* thresholds are in units per minute
+    threshold: float = Field(allow_inf_nan=False)
+    window_seconds: int = Field(300, gt=0, le=86400)  # mean_* and std_* only
+    enabled: bool = True
+
 class MetricModel(Base):
     __tablename__ = METRICS
 
@@ -0,0 +1,124 @@
+import os
+import sys
+import uuid
+import asyncio
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# Per-request profiles kept in memory for retrieval
+MAX_REQUEST_PROFILES = 20
+
+
+class SamplingProfiler:
+    """Samples thread stacks from a background thread at a fixed interval
+
+    The profiled code is not instrumented, so overhead is one stack walk per
+    interval. Stacks are counted in collapsed format (root;...;leaf).
+    """
+
+    def __init__(self, interval: float = 0.005, thread_id: Optional[int] = None):
+        self.interval = interval
+        self.thread_id = thread_id
+        self.samples = 0
+        self.counts: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.counts
+
+    def _run(self):
+        own_id = threading.get_ident()
+        # Thread names are looked up once; threads started later show their id
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            if self.thread_id is not None:
+                frame = frames.get(self.thread_id)
+                if frame is not None:
+                    self._record(names, self.thread_id, frame)
+            else:
+                for thread_id, frame in frames.items():
+                    if thread_id != own_id:
+                        self._record(names, thread_id, frame)
+            self.samples += 1
+
+    def _record(self, names: dict, thread_id: int, frame):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            filename = os.path.basename(code.co_filename)
+            stack.append(f"{code.co_name} ({filename}:{code.co_firstlineno})")
+            frame = frame.f_back
+        stack.append(names.get(thread_id, str(thread_id)))
+
+        self.counts[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Render counts in the format flamegraph.pl and speedscope read"""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.counts.most_common()
+        )
+
+
+_profile_lock = asyncio.Lock()
+
+
+def is_profiling() -> bool:
+    return _profile_lock.locked()
+
+
+async def profile_process(seconds: float, interval: float) -> str:
+    """Sample every thread of the live process for `seconds`"""
+    async with _profile_lock:
+        profiler = SamplingProfiler(interval=interval)
+        profiler.start()
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            profiler.stop()
+
+    logger.info(f"Profiled process for {seconds}s ({profiler.samples} samples)")
+    return profiler.collapsed()
+
+
+request_profiles: "OrderedDict[str, str]" = OrderedDict()
+
+
+def start_request_profile(interval: float) -> SamplingProfiler:
+    """Sample the event loop thread while a request is handled
+
+    Other requests served concurrently on the loop show up in the samples too.
+    """
+    profiler = SamplingProfiler(interval=interval, thread_id=threading.get_ident())
+    profiler.start()
+    return profiler
+
+
+def finish_request_profile(profiler: SamplingProfiler, path: str) -> str:
+    profiler.stop()
+    profile_id = uuid.uuid4().hex
+    request_profiles[profile_id] = profiler.collapsed()
+    while len(request_profiles) > MAX_REQUEST_PROFILES:
+        request_profiles.popitem(last=False)
+
+    logger.info(f"Profiled {path} as {profile_id} ({profiler.samples} samples)")
+    return profile_id
+
+
+def get_request_profile(profile_id: str) -> Optional[str]:
+    return request_profiles.get(profile_id)
+
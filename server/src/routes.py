@@ -1,24 +1,64 @@
+import os
 import asyncio
-from fastapi import APIRouter, WebSocket, Query
+from fastapi import (
+    APIRouter,
+    WebSocket,
+    WebSocketDisconnect,
+    Query,
+    HTTPException,
+    Request,
+    Response,
+    Depends,
+)
+from fastapi.responses import PlainTextResponse
 from typing import Optional
+from datetime import datetime
 from database import Database
-from models import Metric, MetricModel, SensorType
+from models import Metric, MetricModel, SensorType, AlarmRule
 from ml_service import predict_sensor, clear_all_models, clear_sensor_model
+from alarm_service import alarm_engine
+from admission import ingest_admission
+from profiler import profile_process, is_profiling, get_request_profile
 
 router = APIRouter()
 
-metrics_queue = asyncio.Queue()
+
+def require_admin(request: Request):
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token or request.headers.get("admin") != admin_token:
+        raise HTTPException(status_code=403, detail="Admin only")
+
+
+# Only included by main.py when PROFILING_ENABLED is set
+admin_router = APIRouter(prefix="/admin", dependencies=[Depends(require_admin)])
+
+# Bounded so metrics nobody is reading cannot grow memory without limit
+metrics_queue = asyncio.Queue(maxsize=1000)
+metrics_subscribers = 0
+# Oldest queued metrics dropped for newer ones while someone was listening
+dropped_broadcasts = 0
+
+
+def broadcast_metric(metric_data: dict):
+    """Queue a metric for /ws-metrics, dropping the oldest one when full"""
+    global dropped_broadcasts
+    if metrics_queue.full():
+        metrics_queue.get_nowait()
+        if metrics_subscribers:
+            dropped_broadcasts += 1
+    metrics_queue.put_nowait(metric_data)
 
 
 @router.post("/metric", status_code=201)
 async def create_metric(metric: Metric) -> dict:
-    metric_model = MetricModel(
-        source=metric.source,
-        sensor=metric.sensor,
-        value=metric.value,
-    )
+    with ingest_admission.admit(metric.source):
+        metric_model = MetricModel(
+            source=metric.source,
+            sensor=metric.sensor,
+            value=metric.value,
+        )
 
-    metric_id = await Database.create_metric(metric_model)
+        metric_id = await Database.create_metric(metric_model)
 
     # Create serializable dict for WebSocket
     metric_data = {
@@ -31,34 +71,144 @@ async def create_metric(metric: Metric) -> dict:
         ),
     }
 
-    await metrics_queue.put(metric_data)
+    broadcast_metric(metric_data)
+
+    alarm_engine.evaluate(
+        metric.sensor,
+        metric.source,
+        metric.value,
+        metric_model.timestamp.timestamp() if metric_model.timestamp else None,
+    )
     return {"id": metric_id}
 
 
+@router.get("/metric/stats")
+async def get_ingest_stats():
+    return {
+        "admission": ingest_admission.stats(),
+        "broadcast": {
+            "subscribers": metrics_subscribers,
+            "queued": metrics_queue.qsize(),
+            "dropped": dropped_broadcasts,
+        },
+    }
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match list against `etag` (RFC 9110)"""
+    if not if_none_match:
+        return False
+
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*":
+            return True
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+
 @router.get("/metrics/history")
 async def get_metrics_history(
+    request: Request,
+    response: Response,
     sensor: SensorType = Query(..., description="Sensor type"),
     from_time: Optional[str] = Query(None, description="Start time (ISO format)"),
     to_time: Optional[str] = Query(None, description="End time (ISO format)"),
     target_points: int = Query(
         60, description="Target number of points to return", le=500
     ),
+    since: Optional[datetime] = Query(
+        None, description="Only return buckets at or after this bucket timestamp"
+    ),
+    origin: Optional[datetime] = Query(
+        None, description="Bucket grid origin from a previous response"
+    ),
+    bucket_minutes: Optional[int] = Query(
+        None, description="Bucket size from a previous response", ge=1
+    ),
 ):
-    data = await Database.get_metrics_history(
-        sensor=sensor, from_time=from_time, to_time=to_time, target_points=target_points
+    window = Database.get_history_window(
+        from_time, to_time, target_points, since, origin, bucket_minutes
     )
-    return {"data": data, "count": len(data)}
+    if window is None:
+        return {
+            "data": [],
+            "count": 0,
+            "cursor": since,
+            "origin": origin,
+            "bucket_minutes": bucket_minutes,
+        }
+
+    etag = f'"{await Database.get_window_etag(sensor, window)}"'
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+
+    data = await Database.get_window_metrics(sensor, window)
+    return {
+        "data": data,
+        "count": len(data),
+        "cursor": data[-1]["timestamp"] if data else since,
+        "origin": window.origin,
+        "bucket_minutes": window.bucket_minutes,
+    }
 
 
 @router.websocket("/ws-metrics")
 async def ws_metrics(websocket: WebSocket):
+    global metrics_subscribers
     await websocket.accept()
-    while True:
-        try:
-            metric = await metrics_queue.get()
-            await websocket.send_json(metric)
-        except Exception:
-            break
+    metrics_subscribers += 1
+    try:
+        while True:
+            try:
+                metric = await metrics_queue.get()
+                await websocket.send_json(metric)
+            except Exception:
+                break
+    finally:
+        metrics_subscribers -= 1
+
+
+# Alarm Endpoints
+@router.get("/alarms/rules")
+async def list_alarm_rules():
+    return {
+        "rules": [
+            {"id": rule_id, **rule.model_dump()}
+            for rule_id, rule in alarm_engine.rules.items()
+        ],
+        "dropped_events": alarm_engine.dropped_events,
+    }
+
+
+@router.post("/alarms/rules", status_code=201)
+async def create_alarm_rule(rule: AlarmRule):
+    return {"id": alarm_engine.add_rule(rule)}
+
+
+@router.delete("/alarms/rules/{rule_id}")
+async def delete_alarm_rule(rule_id: str):
+    if not alarm_engine.remove_rule(rule_id):
+        raise HTTPException(status_code=404, detail="Rule not found")
+    return {"message": f"Rule {rule_id} deleted successfully"}
+
+
+@router.websocket("/ws-alarms")
+async def ws_alarms(websocket: WebSocket):
+    await websocket.accept()
+    queue = alarm_engine.subscribe()
+    try:
+        while True:
+            event = await queue.get()
+            await websocket.send_json(event)
+    except (WebSocketDisconnect, RuntimeError):
+        pass
+    finally:
+        alarm_engine.unsubscribe(queue)
 
 
 # ML Endpoints
@@ -91,3 +241,27 @@ async def clear_models_endpoint():
 async def clear_sensor_model_endpoint(sensor_type: str):
     clear_sensor_model(sensor_type)
     return {"message": f"Model for sensor {sensor_type} cleared successfully"}
+
+
+# Admin Endpoints
+@admin_router.get("/profile", response_class=PlainTextResponse)
+async def profile_endpoint(
+    seconds: float = Query(10, description="Sampling duration", gt=0, le=120),
+    interval_ms: float = Query(5, description="Sampling interval", ge=1, le=1000),
+):
+    if is_profiling():
+        raise HTTPException(status_code=409, detail="Profiler already running")
+
+    collapsed = await profile_process(seconds, interval_ms / 1000)
+    return PlainTextResponse(
+        collapsed,
+        headers={"Content-Disposition": 'attachment; filename="profile.folded"'},
+    )
+
+
+@admin_router.get("/profile/requests/{profile_id}", response_class=PlainTextResponse)
+async def request_profile_endpoint(profile_id: str):
+    collapsed = get_request_profile(profile_id)
+    if collapsed is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(collapsed)
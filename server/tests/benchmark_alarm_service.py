@@ -0,0 +1,76 @@
+"""Per-reading and per-rule-change cost of AlarmEngine
+
+Run with `PYTHONPATH=src uv run python tests/benchmark_alarm_service.py`.
+Kept out of the test suite because wall-clock numbers depend on the machine.
+"""
+
+import random
+import time
+
+from alarm_service import AlarmEngine
+from models import AlarmRule
+
+SOURCES = 20
+STREAMS = 1000
+READINGS = 20000
+
+
+def main():
+    rng = random.Random(28)
+    engine = AlarmEngine()
+
+    start = time.perf_counter()
+    for i in range(1000):
+        engine.add_rule(
+            AlarmRule(sensor="temperature", type="above", threshold=20 + i / 100)
+        )
+    for i in range(1000):
+        engine.add_rule(
+            AlarmRule(
+                sensor="temperature",
+                source=f"s{i % SOURCES}",
+                type="below",
+                threshold=i / 100,
+            )
+        )
+    added = time.perf_counter() - start
+    print(f"add 2000 rules: {added * 1e3:.1f} ms")
+
+    # Sensor-like random walk: each reading crosses a few thresholds at most
+    values = [25.0] * SOURCES
+    transitions = 0
+    start = time.perf_counter()
+    for i in range(READINGS):
+        source = i % SOURCES
+        values[source] += rng.uniform(-0.05, 0.05)
+        transitions += len(
+            engine.evaluate("temperature", f"s{source}", values[source], ts=float(i))
+        )
+    changing = (time.perf_counter() - start) / READINGS
+    print(
+        f"changing values: {changing * 1e6:.1f} us/reading "
+        f"({transitions / READINGS:.1f} transitions/reading)"
+    )
+
+    start = time.perf_counter()
+    for i in range(READINGS):
+        source = i % SOURCES
+        engine.evaluate(
+            "temperature", f"s{source}", values[source], ts=float(READINGS + i)
+        )
+    unchanged = (time.perf_counter() - start) / READINGS
+    print(f"unchanged values: {unchanged * 1e6:.1f} us/reading")
+
+    for i in range(STREAMS):
+        engine.evaluate("temperature", f"stream{i}", 25.0, ts=float(2 * READINGS))
+    start = time.perf_counter()
+    for i in range(100):
+        engine.remove_rule(
+            engine.add_rule(AlarmRule(sensor="temperature", type="above", threshold=i))
+        )
+    changed = (time.perf_counter() - start) / 200
+    print(f"rule change with {STREAMS} streams: {changed * 1e6:.1f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import pytest
+from fastapi import HTTPException
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+
+import admission
+from admission import AdmissionController
+
+
+def status(controller: AdmissionController, source: str = "a"):
+    try:
+        with controller.admit(source):
+            return 201
+    except HTTPException as e:
+        return e.status_code, e.headers["Retry-After"]
+
+
+def test_rate_limit_allows_burst_then_429():
+    controller = AdmissionController(max_in_flight=10, rate_per_source=1, burst=3)
+
+    results = [status(controller) for _ in range(5)]
+
+    assert results == [201, 201, 201, (429, "1"), (429, "1")]
+    assert status(controller, "b") == 201
+    assert controller.stats()["rejected_rate_limited"] == 2
+
+
+def test_in_flight_limit_returns_503():
+    controller = AdmissionController(max_in_flight=2, rate_per_source=0)
+
+    with controller.admit("a"), controller.admit("b"):
+        assert status(controller, "c") == (503, "1")
+
+    assert controller.in_flight == 0
+    assert status(controller, "c") == 201
+    assert controller.stats()["rejected_overloaded"] == 1
+
+
+def test_pool_timeout_becomes_503():
+    controller = AdmissionController(rate_per_source=0)
+
+    with pytest.raises(HTTPException) as excinfo:
+        with controller.admit("a"):
+            raise PoolTimeoutError("QueuePool limit reached")
+
+    assert excinfo.value.status_code == 503
+    assert excinfo.value.headers["Retry-After"] == "1"
+    assert controller.in_flight == 0
+    assert controller.stats()["rejected_pool_timeout"] == 1
+
+
+def test_tracked_sources_are_capped_in_lru_order(monkeypatch):
+    monkeypatch.setattr(admission, "MAX_TRACKED_SOURCES", 3)
+    controller = AdmissionController(rate_per_source=1, burst=1)
+
+    for source in ("a", "b", "c"):
+        status(controller, source)
+    # "a" is now the most recently seen, so "b" is evicted next
+    assert status(controller, "a") == (429, "1")
+    status(controller, "d")
+
+    assert controller.stats()["tracked_sources"] == 3
+    assert status(controller, "b") == 201
+    assert status(controller, "a") == (429, "1")
@@ -0,0 +1,265 @@
+import math
+import random
+import statistics
+
+import pytest
+
+import alarm_service
+from alarm_service import AlarmEngine, ThresholdGroup, WindowStats
+from models import AlarmRule
+
+
+def rule(**kwargs) -> AlarmRule:
+    return AlarmRule(sensor="temperature", **kwargs)
+
+
+def states(events):
+    return [(event["type"], event["state"]) for event in events]
+
+
+def test_window_stats_matches_statistics_over_window():
+    rng = random.Random(28)
+    window = WindowStats(60)
+    samples = [(ts * 7.0, rng.uniform(-10, 40)) for ts in range(200)]
+
+    for ts, value in samples:
+        window.add(ts, value)
+        in_window = [v for t, v in samples if ts - 60 <= t <= ts]
+        assert window.mean == pytest.approx(statistics.fmean(in_window))
+        assert window.std == pytest.approx(
+            statistics.pstdev(in_window), abs=1e-6
+        )
+
+
+def test_window_stats_does_not_drift_over_long_streams():
+    rng = random.Random(28)
+    window = WindowStats(60)
+    values = [50000 + rng.uniform(-0.01, 0.01) for _ in range(200000)]
+
+    for ts, value in enumerate(values):
+        window.add(float(ts), value)
+
+    in_window = values[-61:]
+    assert window.mean == pytest.approx(statistics.fmean(in_window), abs=1e-9)
+    assert window.std == pytest.approx(statistics.pstdev(in_window), rel=1e-3)
+
+
+def test_window_stats_single_sample_has_zero_std():
+    window = WindowStats(60)
+    window.add(0.0, 5.0)
+    assert window.mean == 5.0
+    assert window.std == 0.0
+
+
+def test_threshold_rules_only_publish_transitions():
+    engine = AlarmEngine()
+    engine.add_rule(rule(type="above", threshold=30))
+    engine.add_rule(rule(type="below", threshold=10))
+
+    readings = [20, 31, 35, 20, 5, 4, 15]
+    results = [
+        states(engine.evaluate("temperature", "a", v, ts=i))
+        for i, v in enumerate(readings)
+    ]
+
+    assert results == [
+        [],
+        [("above", "triggered")],
+        [],
+        [("above", "cleared")],
+        [("below", "triggered")],
+        [],
+        [("below", "cleared")],
+    ]
+
+
+def test_only_crossed_thresholds_transition():
+    engine = AlarmEngine()
+    ids = {t: engine.add_rule(rule(type="above", threshold=t)) for t in range(10)}
+
+    events = engine.evaluate("temperature", "a", 4.5, ts=0)
+    assert sorted(e["rule_id"] for e in events) == sorted(ids[t] for t in range(5))
+
+    events = engine.evaluate("temperature", "a", 7.5, ts=1)
+    assert {e["rule_id"] for e in events} == {ids[5], ids[6], ids[7]}
+    assert {e["state"] for e in events} == {"triggered"}
+
+    events = engine.evaluate("temperature", "a", 2.0, ts=2)
+    assert {e["rule_id"] for e in events} == {ids[t] for t in range(2, 8)}
+    assert {e["state"] for e in events} == {"cleared"}
+
+
+def test_threshold_equal_to_value_is_not_triggered():
+    engine = AlarmEngine()
+    engine.add_rule(rule(type="above", threshold=30))
+    engine.add_rule(rule(type="below", threshold=30))
+
+    assert engine.evaluate("temperature", "a", 30, ts=0) == []
+
+
+def test_rate_and_window_rules():
+    engine = AlarmEngine()
+    engine.add_rule(rule(type="rate_above", threshold=5))
+    engine.add_rule(rule(type="mean_above", threshold=25, window_seconds=60))
+    engine.add_rule(rule(type="std_above", threshold=10, window_seconds=60))
+
+    readings = [20, 22, 31, 35, 20, 20]
+    results = [
+        states(engine.evaluate("temperature", "a", v, ts=i * 10.0))
+        for i, v in enumerate(readings)
+    ]
+
+    assert results == [
+        [],
+        [("rate_above", "triggered")],
+        [],
+        [("mean_above", "triggered")],
+        [("rate_above", "cleared")],
+        [("mean_above", "cleared")],
+    ]
+
+
+def test_source_specific_and_wildcard_rules():
+    engine = AlarmEngine()
+    only_a = engine.add_rule(rule(source="a", type="above", threshold=30))
+    any_source = engine.add_rule(rule(type="above", threshold=30))
+
+    events = engine.evaluate("temperature", "a", 40, ts=0)
+    assert {e["rule_id"] for e in events} == {only_a, any_source}
+
+    events = engine.evaluate("temperature", "b", 40, ts=0)
+    assert {e["rule_id"] for e in events} == {any_source}
+
+    assert engine.evaluate("humidity", "a", 40, ts=0) == []
+
+
+def test_new_rule_reports_streams_already_past_threshold():
+    engine = AlarmEngine()
+    engine.add_rule(rule(type="above", threshold=10))
+    engine.evaluate("temperature", "a", 40, ts=0)
+
+    queue = engine.subscribe()
+    rule_id = engine.add_rule(rule(type="above", threshold=30))
+
+    event = queue.get_nowait()
+    assert event["rule_id"] == rule_id
+    assert event["state"] == "triggered"
+    # Already triggered, so the next reading past the threshold is silent
+    assert engine.evaluate("temperature", "a", 41, ts=1) == []
+
+
+def test_new_rule_on_unobserved_stream_triggers_on_next_reading():
+    engine = AlarmEngine()
+    engine.evaluate("temperature", "a", 40, ts=0)
+    rule_id = engine.add_rule(rule(type="above", threshold=30))
+
+    events = engine.evaluate("temperature", "a", 41, ts=1)
+    assert [(e["rule_id"], e["state"]) for e in events] == [(rule_id, "triggered")]
+
+
+def test_removed_and_disabled_rules_are_ignored():
+    engine = AlarmEngine()
+    removed = engine.add_rule(rule(type="above", threshold=30))
+    engine.add_rule(rule(type="above", threshold=30, enabled=False))
+    engine.remove_rule(removed)
+
+    assert engine.evaluate("temperature", "a", 40, ts=0) == []
+
+
+def test_slow_subscriber_drops_events():
+    engine = AlarmEngine()
+    engine.add_rule(rule(type="above", threshold=30))
+    queue = engine.subscribe()
+
+    for i in range(queue.maxsize + 10):
+        engine.evaluate("temperature", "a", 40 if i % 2 == 0 else 20, ts=i)
+
+    assert queue.full()
+    assert engine.dropped_events == 10
+
+
+def test_non_finite_readings_are_ignored():
+    engine = AlarmEngine()
+    engine.add_rule(rule(type="mean_above", threshold=25, window_seconds=60))
+    engine.evaluate("temperature", "a", 20, ts=0)
+
+    assert engine.evaluate("temperature", "a", math.nan, ts=1) == []
+    assert engine.evaluate("temperature", "a", math.inf, ts=2) == []
+    events = engine.evaluate("temperature", "a", 40, ts=3)
+    assert [e["observed"] for e in events] == [30.0]
+
+
+def test_metric_rejects_non_finite_values():
+    from pydantic import ValidationError
+
+    from models import Metric
+
+    with pytest.raises(ValidationError):
+        Metric(source="a", sensor="light", value=math.nan)
+
+
+def test_streams_without_rules_keep_no_state():
+    engine = AlarmEngine()
+    engine.add_rule(rule(source="watched", type="above", threshold=30))
+
+    for i in range(100):
+        engine.evaluate("temperature", f"s{i}", 20, ts=i)
+        engine.evaluate("humidity", "watched", 20, ts=i)
+    engine.evaluate("temperature", "watched", 20, ts=0)
+
+    assert list(engine._streams) == [("temperature", "watched")]
+    assert list(engine._groups) == [("temperature", "watched")]
+
+
+def test_stream_state_is_capped_in_lru_order(monkeypatch):
+    monkeypatch.setattr(alarm_service, "MAX_STREAMS", 3)
+    engine = AlarmEngine()
+    engine.add_rule(rule(type="above", threshold=30))
+
+    for source in ("a", "b", "c", "a", "d"):
+        engine.evaluate("temperature", source, 20, ts=0)
+
+    assert [source for _, source in engine._streams] == ["c", "a", "d"]
+
+
+def test_rule_changes_only_rebuild_the_changed_key():
+    engine = AlarmEngine()
+    engine.add_rule(rule(source="a", type="above", threshold=30))
+    engine.add_rule(rule(type="above", threshold=10))
+    engine.evaluate("temperature", "a", 20, ts=0)
+    engine.evaluate("temperature", "b", 20, ts=0)
+    exact = engine._groups[("temperature", "a")]
+
+    engine.add_rule(rule(type="mean_above", threshold=25, window_seconds=60))
+
+    # The exact-source groups survive; the wildcard ones rebuild on next use
+    assert engine._groups[("temperature", "a")] is exact
+    assert ("temperature", None) not in engine._groups
+    engine.evaluate("temperature", "a", 20, ts=1)
+    assert list(engine._streams[("temperature", "a")].windows) == [60]
+
+
+def test_evaluation_bisects_groups_instead_of_visiting_rules(monkeypatch):
+    """Work per reading depends on groups and transitions, not rule count"""
+    calls = []
+    transitions = ThresholdGroup.transitions
+
+    def counting(self, previous, observed):
+        calls.append(len(self.thresholds))
+        return transitions(self, previous, observed)
+
+    monkeypatch.setattr(ThresholdGroup, "transitions", counting)
+
+    def groups_per_reading(rule_count):
+        engine = AlarmEngine()
+        for i in range(rule_count):
+            engine.add_rule(rule(type="above", threshold=20 + i / rule_count))
+            engine.add_rule(rule(source="a", type="below", threshold=i / rule_count))
+        engine.evaluate("temperature", "a", 10, ts=0)
+        calls.clear()
+        events = engine.evaluate("temperature", "a", 10, ts=1)
+        return len(calls), len(events)
+
+    assert groups_per_reading(10) == (2, 0)
+    assert groups_per_reading(1000) == (2, 0)
+    assert calls == [1000, 1000]
@@ -0,0 +1,109 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from backfill import (
+    asyncpg_dsn,
+    detect_format,
+    parse_batch,
+    parse_timestamp,
+    read_rows,
+    to_record,
+)
+
+
+def test_detect_format_from_extension():
+    assert detect_format("readings.CSV") == "csv"
+    assert detect_format("readings.jsonl") == "ndjson"
+    assert detect_format("readings.ndjson") == "ndjson"
+    assert detect_format("readings.parquet") == "parquet"
+    with pytest.raises(ValueError):
+        detect_format("readings.txt")
+
+
+def test_parse_timestamp_keeps_offsets_and_assumes_utc():
+    assert parse_timestamp("2025-01-01T10:00:00Z") == datetime(
+        2025, 1, 1, 10, tzinfo=timezone.utc
+    )
+    assert parse_timestamp("2025-01-01T10:00:00") == datetime(
+        2025, 1, 1, 10, tzinfo=timezone.utc
+    )
+
+    offset = parse_timestamp("2025-01-01T10:00:00-06:00")
+    assert offset.utcoffset() == timedelta(hours=-6)
+    assert parse_timestamp(datetime(2025, 1, 1)).tzinfo is timezone.utc
+
+
+def test_to_record_converts_valid_rows():
+    record = to_record(
+        {
+            "timestamp": "2025-01-01T10:00:00",
+            "source": 7,
+            "sensor": "humidity",
+            "value": "41.5",
+        }
+    )
+
+    assert record == (
+        datetime(2025, 1, 1, 10, tzinfo=timezone.utc),
+        "7",
+        "humidity",
+        41.5,
+    )
+
+
+@pytest.mark.parametrize(
+    "row",
+    [
+        {},
+        {"timestamp": "2025-01-01", "source": "a", "sensor": "pressure", "value": 1},
+        {"timestamp": "yesterday", "source": "a", "sensor": "light", "value": 1},
+        {"timestamp": "2025-01-01", "source": "a", "sensor": "light", "value": "x"},
+        {"timestamp": "2025-01-01", "sensor": "light", "value": 1},
+    ],
+)
+def test_to_record_rejects_invalid_rows(row):
+    assert to_record(row) is None
+
+
+def test_parse_batch_reads_in_chunks_and_counts_skips(tmp_path):
+    path = tmp_path / "readings.ndjson"
+    path.write_text(
+        '{"timestamp": "2025-01-01T00:00:00Z", "source": "a", "sensor": "light", "value": 1}\n'
+        "not json\n"
+        "\n"
+        '{"timestamp": "2025-01-01T00:01:00Z", "source": "a", "sensor": "light", "value": 2}\n'
+        '{"timestamp": "2025-01-01T00:02:00Z", "source": "a", "sensor": "bad", "value": 3}\n'
+    )
+    rows = read_rows(str(path), "ndjson", 2)
+
+    # Malformed JSON counts as a skipped row, blank lines are ignored
+    records, skipped, read = parse_batch(rows, 2)
+    assert ([r[3] for r in records], skipped, read) == ([1.0], 1, 2)
+
+    records, skipped, read = parse_batch(rows, 2)
+    assert ([r[3] for r in records], skipped, read) == ([2.0], 1, 2)
+
+    assert parse_batch(rows, 2) == ([], 0, 0)
+
+
+def test_parse_batch_reads_csv(tmp_path):
+    path = tmp_path / "readings.csv"
+    path.write_text(
+        "timestamp,source,sensor,value\n"
+        "2025-01-01T00:00:00Z,a,temperature,20.5\n"
+        "2025-01-01T00:01:00Z,a,temperature,21\n"
+    )
+
+    records, skipped, read = parse_batch(read_rows(str(path), "csv", 10), 10)
+
+    assert [r[3] for r in records] == [20.5, 21.0]
+    assert (skipped, read) == (0, 2)
+
+
+def test_asyncpg_dsn_strips_driver():
+    assert (
+        asyncpg_dsn("postgresql+asyncpg://admin:pw@localhost:5432/db")
+        == "postgresql://admin:pw@localhost:5432/db"
+    )
+    assert asyncpg_dsn("postgresql://h/db") == "postgresql://h/db"
@@ -0,0 +1,43 @@
+import threading
+import time
+
+from profiler import SamplingProfiler
+
+
+def busy_loop(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_collapsed_stacks_cover_only_the_sampled_thread():
+    stop = threading.Event()
+    worker = threading.Thread(target=busy_loop, args=(stop,), name="worker")
+    worker.start()
+    try:
+        profiler = SamplingProfiler(interval=0.002, thread_id=worker.ident)
+        profiler.start()
+        time.sleep(0.2)
+        profiler.stop()
+    finally:
+        stop.set()
+        worker.join()
+
+    lines = profiler.collapsed().splitlines()
+    assert profiler.samples > 0
+    assert lines
+    for line in lines:
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0
+        assert stack.startswith("worker;")
+    assert any("busy_loop (test_profiler.py:" in line for line in lines)
+
+
+def test_whole_process_profile_skips_the_sampler_thread():
+    profiler = SamplingProfiler(interval=0.002)
+    profiler.start()
+    time.sleep(0.05)
+    profiler.stop()
+
+    assert profiler.samples > 0
+    assert "MainThread;" in profiler.collapsed()
+    assert "sampling-profiler" not in profiler.collapsed()
@@ -0,0 +1,77 @@
+import asyncio
+from datetime import datetime, timezone
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import routes
+from database import Database, HistoryWindow
+from routes import etag_matches
+
+T0 = datetime(2025, 1, 1, tzinfo=timezone.utc)
+ETAG = '"abc"'
+
+
+def test_etag_matches_lists_weak_tags_and_wildcard():
+    assert etag_matches(ETAG, ETAG)
+    assert etag_matches(f'"old", {ETAG}', ETAG)
+    assert etag_matches(f'W/{ETAG}', ETAG)
+    assert etag_matches("*", ETAG)
+    assert not etag_matches('"old"', ETAG)
+    assert not etag_matches(None, ETAG)
+    assert not etag_matches("", ETAG)
+
+
+def test_history_resolves_the_window_once(monkeypatch):
+    window = HistoryWindow(T0, T0.replace(hour=1), T0, 5)
+    resolved, seen = [], []
+
+    def get_history_window(*args):
+        resolved.append(args)
+        return window
+
+    async def get_window_etag(sensor, used):
+        seen.append(used)
+        return "abc"
+
+    async def get_window_metrics(sensor, used):
+        seen.append(used)
+        return []
+
+    monkeypatch.setattr(Database, "get_history_window", get_history_window)
+    monkeypatch.setattr(Database, "get_window_etag", get_window_etag)
+    monkeypatch.setattr(Database, "get_window_metrics", get_window_metrics)
+    app = FastAPI()
+    app.include_router(routes.router)
+    client = TestClient(app)
+
+    response = client.get("/metrics/history", params={"sensor": "light"})
+    assert response.status_code == 200
+    assert response.headers["ETag"] == ETAG
+    assert response.json()["bucket_minutes"] == 5
+
+    response = client.get(
+        "/metrics/history",
+        params={"sensor": "light"},
+        headers={"If-None-Match": f'"old", W/{ETAG}'},
+    )
+    assert response.status_code == 304
+
+    assert len(resolved) == 2
+    assert seen == [window, window, window]
+
+
+def test_full_broadcast_queue_drops_oldest(monkeypatch):
+    monkeypatch.setattr(routes, "metrics_queue", asyncio.Queue(maxsize=2))
+    monkeypatch.setattr(routes, "dropped_broadcasts", 0)
+
+    for i in range(4):
+        routes.broadcast_metric({"id": i})
+    # Nobody was listening, so nothing counts as dropped
+    assert routes.dropped_broadcasts == 0
+
+    monkeypatch.setattr(routes, "metrics_subscribers", 1)
+    routes.broadcast_metric({"id": 4})
+
+    assert routes.dropped_broadcasts == 1
+    assert [routes.metrics_queue.get_nowait()["id"] for _ in range(2)] == [3, 4]